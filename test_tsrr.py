@@ -0,0 +1,164 @@
+from math import comb
+
+import numpy as np
+import pytest
+
+import tsrr
+
+
+def _expected_rank_by_sum(grank, ns, nt):
+    # the original combinatorial definition: sum of rank * P(first target at rank)
+    n = ns + nt
+    return grank + sum(rank * comb(n - rank, nt - 1) / comb(n, nt) for rank in range(1, n + 1))
+
+
+@pytest.mark.parametrize("ns", range(0, 9))
+@pytest.mark.parametrize("nt", range(1, 7))
+def test_expected_rank_matches_combinatorial_sum(ns, nt):
+    assert tsrr.expected_rank(3, ns, nt) == pytest.approx(_expected_rank_by_sum(3, ns, nt))
+
+
+def _tie_heavy_batch(rng, B, N):
+    # few distinct scores and labels, so most rows have ties around the first relevant
+    sims = rng.choice([-np.inf, 0.1, 0.5, 0.9, np.inf], size=(B, N))
+    match = rng.integers(0, 4, size=(B, N)) == rng.integers(0, 5, size=(B, 1))
+    return sims, match
+
+
+@pytest.mark.skipif(tsrr._tsrr_kernel is None, reason="numba is not installed")
+def test_kernel_matches_numpy_batch():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        sims, match = _tie_heavy_batch(rng, rng.integers(1, 8), rng.integers(1, 12))
+        np.testing.assert_allclose(tsrr._tsrr_kernel(sims, match), tsrr._tsrr_batch(sims, match))
+
+
+@pytest.fixture(params=["numba", "numpy"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        monkeypatch.setattr(tsrr, "_tsrr_kernel", None)
+    elif tsrr._tsrr_kernel is None:
+        pytest.skip("numba is not installed")
+    return request.param
+
+
+def test_nan_similarity_of_relevant_is_rejected(backend):
+    with pytest.raises(ValueError, match="NaN"):
+        tsrr.tsrr(['a'], [['a', 'a', 'c']], [[0.5, np.nan, 0.9]], reduction='none')
+
+
+def test_nan_similarity_of_irrelevant_is_ignored(backend):
+    # the NaN item is neither above nor tied with the relevant one, but still counts in N_irr
+    scores = tsrr.tsrr(['a', 'a'], [['a', 'b', 'c'], ['a', 'b', 'c']],
+                       [[0.5, np.nan, 0.9], [0.5, np.nan, 0.5]], reduction='none')
+    np.testing.assert_allclose(scores, [1 / 2, 1 / (0 + 0.5 * 1.5 + 0.5 * 2)])
+
+
+@pytest.mark.parametrize("label_dtype", [np.float16, np.longdouble, '>i4', np.uint8, bool])
+def test_label_dtypes(backend, label_dtype):
+    results = np.array([[1, 0, 1], [0, 0, 1]], dtype=label_dtype)
+    target = np.array([1, 0], dtype=label_dtype)
+    scores = tsrr.tsrr(target, results, np.array([[0.2, 0.9, 0.5], [0.3, 0.3, 0.3]]),
+                       reduction='none')
+    np.testing.assert_allclose(scores, [1 / 2, 1 / 2])
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64, np.float16, '>f8'])
+def test_similarity_dtypes(backend, dtype):
+    rng = np.random.default_rng(1)
+    # scores on a 1/8 grid are exact in every tested dtype, so ties do not move
+    sims = rng.integers(0, 8, size=(20, 15)) / 8
+    results = rng.integers(0, 3, size=(20, 15))
+    target = rng.integers(0, 4, size=20)
+    expected = tsrr.tsrr(target, results, sims, reduction='none')
+    scores = tsrr.tsrr(target, results, sims.astype(dtype), reduction='none', dtype=dtype)
+    np.testing.assert_allclose(scores, expected)
+
+
+def test_list_targets_match_array_targets(backend):
+    results = np.array([[1, 2, 3], [2, 2, 1]])
+    sims = np.array([[0.1, 0.2, 0.2], [0.3, 0.3, 0.3]])
+    expected = tsrr.tsrr(np.array([1, 2]), results, sims, reduction='none')
+    np.testing.assert_allclose(tsrr.tsrr([1, 2], results, sims, reduction='none'), expected)
+    # a huge int must not be rounded to a float that equals a neighbouring label
+    big = 2 ** 64
+    scores = tsrr.tsrr([-1, big - 1], [[-1, 0], [big, big - 1]], [[1, 2], [3, 2]], reduction='none')
+    np.testing.assert_allclose(scores, [1 / 2, 1 / 2])
+
+
+def test_strict_ranking_is_reciprocal_rank(backend):
+    # no ties: TsRR = 1 / (r_pre + 1)
+    assert tsrr.tsrr('a', ['b', 'c', 'a', 'd'], [0.9, 0.8, 0.7, 0.6]) == pytest.approx(1 / 3)
+
+
+def test_fully_tied_single_relevant_is_pessimistic(backend):
+    # all R candidates tied with one relevant: TsRR = 1 / R
+    assert tsrr.tsrr('a', ['b', 'a', 'c', 'd', 'e'], [0.5] * 5) == pytest.approx(1 / 5)
+
+
+def test_all_relevant_and_no_relevant_rows(backend):
+    scores = tsrr.tsrr(['a', 'z'], [['a', 'a', 'a'], ['a', 'b', 'c']],
+                       [[0.1, 0.5, 0.5], [0.3, 0.2, 0.1]], reduction='none')
+    np.testing.assert_allclose(scores, [1.0, 0.0])
+
+
+def _tsrr_reference(target, results, similarities):
+    # the original sort-based per-target loop
+    scores = []
+    for label, labs, sims in zip(target, results, similarities):
+        order = np.argsort(sims)[::-1]
+        sims, labs = np.asarray(sims)[order], np.asarray(labs, dtype=object)[order]
+        rel_idx = np.where(labs == label)[0]
+        if rel_idx.size == 0:
+            scores.append(0.0)
+            continue
+        s = sims[rel_idx[0]]
+        r_pre = int(np.sum(sims > s))
+        tie_idx = np.where(sims == s)[0]
+        k = int(np.sum(labs[tie_idx] == label))
+        ns = tie_idx.size - k
+        N_irr = labs.size - rel_idx.size
+        tau = 0.0 if N_irr == 0 else ns / N_irr
+        E_L = _expected_rank_by_sum(0, ns, k)
+        scores.append(1.0 / (r_pre + (1.0 - tau) * E_L + tau * (ns + 1.0)))
+    return scores
+
+
+def test_matches_original_implementation(backend):
+    rng = np.random.default_rng(2)
+    for _ in range(200):
+        B, N = rng.integers(1, 6), rng.integers(1, 12)
+        results = rng.choice(['a', 'b', 'c'], size=(B, N)).tolist()
+        sims = rng.choice([0.1, 0.5, 0.9, 1.0], size=(B, N)).tolist()
+        target = rng.choice(['a', 'b', 'c', 'z'], size=B).tolist()
+        np.testing.assert_allclose(tsrr.tsrr(target, results, sims, reduction='none'),
+                                   _tsrr_reference(target, results, sims))
+
+
+@pytest.mark.parametrize("labels", [[0, 1, 2], ['a', 'b', 'c']])
+def test_deduplicate_matches_full_scoring(backend, labels):
+    rng = np.random.default_rng(3)
+    # 30 queries drawn from 4 candidate pools, so rows repeat
+    pools_r = rng.choice(labels, size=(4, 10))
+    pools_s = rng.choice([0.1, 0.5, 0.9], size=(4, 10))
+    pick = rng.integers(0, 4, size=30)
+    target = rng.choice(labels, size=30)
+    results, sims = pools_r[pick], pools_s[pick]
+    expected = tsrr.tsrr(target, results, sims, reduction='none')
+    np.testing.assert_array_equal(
+        tsrr.tsrr(target, results, sims, reduction='none', deduplicate=True), expected)
+    np.testing.assert_array_equal(
+        tsrr.tsrr(target.tolist(), results.tolist(), sims.tolist(), reduction='none',
+                  deduplicate=True), expected)
+    first, inverse = tsrr._unique_rows(sims, results == target[:, None])
+    assert first.size < len(target)
+    np.testing.assert_array_equal(inverse[first], np.arange(first.size))
+
+
+def test_return_types(backend):
+    args = (['a', 'b'], [['a', 'b'], ['a', 'b']], [[0.9, 0.1], [0.9, 0.1]])
+    scores = tsrr.tsrr(*args, reduction='none')
+    assert isinstance(scores, np.ndarray) and scores.dtype == np.float64
+    np.testing.assert_allclose(scores, [1.0, 0.5])
+    mean = tsrr.tsrr(*args)
+    assert type(mean) is float and mean == pytest.approx(0.75)
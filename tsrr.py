@@ -1,6 +1,11 @@
 import numpy as np
 import warnings
-from math import comb
+
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional; fall back to NumPy reductions
+    njit = None
+
 
 def expected_rank(grank, ns: int, nt: int) -> float:
     """
@@ -19,14 +24,134 @@ def expected_rank(grank, ns: int, nt: int) -> float:
     if ns <= 0 or nt <= 0 or nt > ns:
         raise ValueError("Invalid input: ns must be >= nt > 0")
 
-    expected_r = 0.0
-    for rank in range(1, ns + 1):
-        prob = comb(ns - rank, nt - 1) / comb(ns, nt)
-        expected_r += rank * prob
-    return grank + expected_r
+    # E[min position] of nt targets placed uniformly among ns slots
+    return grank + (ns + 1) / (nt + 1)
+
 
+def _unique_rows(sims, match):
+    """
+    Find distinct (similarities, relevance) rows of a batch.
 
-def tsrr(target, results, similarities, alpha=None, reduction='mean'):
+    Returns:
+        tuple: (index of each distinct row's first occurrence, shape [U];
+        position of every row among the distinct rows, shape [B]).
+    """
+    seen = {}
+    first = []
+    inverse = np.empty(len(match), dtype=np.intp)
+    keys = zip(map(np.ndarray.tobytes, sims), map(np.ndarray.tobytes, match))
+    for i, key in enumerate(keys):
+        u = seen.setdefault(key, len(seen))
+        if u == len(first):
+            first.append(i)
+        inverse[i] = u
+    first = np.array(first, dtype=np.intp)
+    return first, inverse
+
+
+def _tsrr_batch(sims, match):
+    """
+    Per-target TsRR scores for a [B, N] batch, as NumPy reductions over axis=1.
+
+    Parameters:
+        sims (np.ndarray): Similarities, shape [B, N].
+        match (np.ndarray): True where a result is relevant (== target), shape [B, N].
+
+    Returns:
+        np.ndarray: TsRR score per target (0 where no result matches, 1 where
+        every result matches).
+    """
+    B, N = sims.shape
+
+    # every reduction below reuses the same relevance mask
+    R_total = np.count_nonzero(match, axis=1)
+
+    # no relevant -> 0; every item relevant -> the first item is relevant -> 1
+    has_match = R_total > 0
+    scores = np.where(has_match & (R_total == N), 1.0, 0.0)
+    active = has_match & (R_total < N)
+    if not active.any():
+        return scores
+    if not active.all():
+        sims, match, R_total = sims[active], match[active], R_total[active]
+
+    # first relevant's similarity: the best score among relevants
+    s = np.where(match, sims, -np.inf).max(axis=1, initial=-np.inf)
+
+    # r_pre: items strictly above this tie
+    r_pre = np.count_nonzero(sims > s[:, None], axis=1)
+
+    # tie group G (all items with the same score s)
+    tie = sims == s[:, None]
+    G = np.count_nonzero(tie, axis=1)
+    k = np.count_nonzero(np.logical_and(tie, match, out=tie), axis=1)  # #relevants in G
+    ns = G - k                     # #irrelevants in G
+
+    # tau = |G_irr| / N_irr (N_irr > 0 for every remaining row)
+    tau = ns / (N - R_total)
+
+    # E[L]: expected rank of FIRST relevant *within tie G*
+    # closed form of expected_rank(0, ns=|G_irr|, nt=k)
+    E_L = (G + 1.0) / (k + 1.0)
+
+    # L_max within the tie
+    L_max = ns + 1.0  # == |G| - k + 1
+
+    # blend expected and worst-case ranks
+    E_tau = (1.0 - tau) * E_L + tau * L_max
+
+    # TsRR
+    scores[active] = 1.0 / (r_pre + E_tau)
+    return scores
+
+
+if njit is not None:
+    @njit(parallel=True, nogil=True, cache=True)
+    def _tsrr_kernel(sims, match):
+        """Compiled equivalent of _tsrr_batch."""
+        B, N = sims.shape
+        scores = np.zeros(B)
+        for i in prange(B):
+            # pass 1: best relevant score s and #relevants overall
+            s = -np.inf
+            R_total = 0
+            for j in range(N):
+                if match[i, j]:
+                    if R_total == 0 or sims[i, j] > s:
+                        s = sims[i, j]
+                    R_total += 1
+            if R_total == 0:
+                continue
+            if R_total == N:
+                # every item is relevant, so the first one is
+                scores[i] = 1.0
+                continue
+
+            # pass 2: items strictly above the tie, and the tie group G
+            r_pre = 0
+            G = 0
+            k = 0
+            for j in range(N):
+                if sims[i, j] > s:
+                    r_pre += 1
+                elif sims[i, j] == s:
+                    G += 1
+                    if match[i, j]:
+                        k += 1
+
+            ns = G - k
+            tau = ns / (N - R_total)
+            E_L = (G + 1.0) / (k + 1.0)
+            L_max = ns + 1.0
+            E_tau = (1.0 - tau) * E_L + tau * L_max
+            scores[i] = 1.0 / (r_pre + E_tau)
+        return scores
+else:
+    _tsrr_kernel = None
+
+
+def tsrr(target, results, similarities, alpha=None, reduction='mean', dtype=np.float64,
+         deduplicate=False):
     """
     Tie-sensitive Reciprocal Rank (TsRR) with tie-size penalty.
 
@@ -34,11 +159,20 @@ def tsrr(target, results, similarities, alpha=None, reduction='mean'):
         E_tau[L] = (1 - tau) * E[L] + tau * L_max
         tau      = |G_irr| / N_irr
         E[L]     = expected rank of the first relevant *within the tie group* G
-                   (computed via combinatorics; see expected_rank with grank=0)
+                   = (|G| + 1) / (k + 1)  (see expected_rank with grank=0)
         L_max    = |G| - k + 1  (worst position of first relevant in G)
 
     Inputs accept single or batched targets, as before.
+    Returns the mean TsRR as a float, or with reduction='none' an np.ndarray
+    of per-target scores.
     'alpha' is deprecated and ignored (kept for backward compatibility).
+    'similarities' may be NaN only for irrelevant results, which are then never
+    ranked above or tied with the first relevant.
+    'dtype' is the float type similarities are scored in; np.float32 halves the
+    memory traffic, but scores that differ only beyond float32 precision tie.
+    The compiled kernel handles float32/float64; other types use NumPy.
+    'deduplicate' scores each distinct row (same similarities and relevant positions) once
+    and copies the score to its repeats; useful when queries share candidate pools.
     """
     if alpha is not None:
         warnings.warn(
@@ -69,12 +203,10 @@ def tsrr(target, results, similarities, alpha=None, reduction='mean'):
         if isinstance(target, np.ndarray):
             if target.ndim != 1:
                 raise ValueError("For multiple targets, 'target' must be 1D.")
-            target = target.tolist()
 
         if isinstance(results, np.ndarray):
             if results.ndim != 2:
                 raise ValueError("For multiple targets, 'results' must be 2D.")
-            results = results.tolist()
         else:
             if not (isinstance(results, list) and all(isinstance(r, list) for r in results)):
                 raise ValueError("For multiple targets, 'results' must be a 2D list/array.")
@@ -82,7 +214,6 @@ def tsrr(target, results, similarities, alpha=None, reduction='mean'):
         if isinstance(similarities, np.ndarray):
             if similarities.ndim != 2:
                 raise ValueError("For multiple targets, 'similarities' must be 2D.")
-            similarities = similarities.tolist()
         else:
             if not (isinstance(similarities, list) and all(isinstance(s, list) for s in similarities)):
                 raise ValueError("For multiple targets, 'similarities' must be a 2D list/array.")
@@ -90,60 +221,61 @@ def tsrr(target, results, similarities, alpha=None, reduction='mean'):
         if len(results) != len(target) or len(similarities) != len(target):
             raise ValueError("Number of rows in 'results'/'similarities' must match #targets.")
 
-        for i, (r_row, s_row) in enumerate(zip(results, similarities)):
-            if len(r_row) != len(s_row):
-                raise ValueError(f"Row {i}: 'results' and 'similarities' lengths differ.")
-
-    # numpy arrays for convenience
-    results = np.array(results, dtype=object)
-    similarities = np.array(similarities, dtype=float)
-
-    scores = []
-    for i, label in enumerate(target):
-        # sort by similarity desc
-        order = np.argsort(similarities[i])[::-1]
-        sims = similarities[i, order]
-        labs = results[i, order]
-
-        # indices of all relevant items (== target)
-        rel_idx = np.where(labs == label)[0]
-        if rel_idx.size == 0:
-            scores.append(0.0)
-            continue
-
-        # first relevant's similarity and position
-        j = rel_idx[0]
-        s = sims[j]
-
-        # r_pre: items strictly above this tie
-        r_pre = int(np.sum(sims > s))
+        if isinstance(results, np.ndarray) and isinstance(similarities, np.ndarray):
+            if results.shape != similarities.shape:
+                raise ValueError("Shapes of 'results' and 'similarities' must match.")
+        else:
+            r_lens = np.fromiter(map(len, results), dtype=np.intp, count=len(results))
+            s_lens = np.fromiter(map(len, similarities), dtype=np.intp, count=len(similarities))
+            bad = np.flatnonzero(r_lens != s_lens)
+            if bad.size:
+                raise ValueError(f"Row {bad[0]}: 'results' and 'similarities' lengths differ.")
 
-        # tie group G (all items with the same score s)
-        tie_idx = np.where(sims == s)[0]
-        G = int(tie_idx.size)
-        k = int(np.sum(labs[tie_idx] == label))  # #relevants in G
-        ns = G - k                               # #irrelevants in G
+    # numpy arrays for convenience (ndarray inputs are used as-is)
+    if not isinstance(target, np.ndarray):
+        # numeric targets keep a native dtype so they compare with ndarray results
+        # without boxing; the round trip rejects lossy casts (e.g. huge ints)
+        as_num = np.array(target)
+        if as_num.dtype.kind in 'biuf' and as_num.tolist() == target:
+            target = as_num
+        else:
+            target = np.array(target, dtype=object)
+    if not isinstance(results, np.ndarray):
+        results = np.array(results, dtype=object)
+    similarities = np.asarray(similarities, dtype=dtype)
 
-        # totals (for tau)
-        N = int(labs.size)
-        R_total = int(np.sum(labs == label))
-        N_irr = N - R_total
+    kinds = {target.dtype.kind, results.dtype.kind}
+    if len(kinds) > 1 and not kinds <= set('biuf'):
+        # keep NumPy from coercing e.g. ints to strings when comparing the two
+        target, results = target.astype(object), results.astype(object)
 
-        # tau = |G_irr| / N_irr (0 if no irrelevants overall)
-        tau = 0.0 if N_irr == 0 else ns / float(N_irr)
+    # mask of all relevant items (== target), one row per target; computed once
+    # here and shared by both backends
+    match = results == target[:, None]
 
-        # E[L]: expected rank of FIRST relevant *within tie G*
-        # use the provided combinatorial routine with grank=0, ns=|G_irr|, nt=k
-        E_L = expected_rank(0, ns, k)
+    # a NaN relevant score has no rank; NaN elsewhere never ranks above or ties
+    # (max() propagates NaN, so the masked check only runs when one exists)
+    if similarities.size and np.isnan(similarities.max()) and np.isnan(similarities[match]).any():
+        raise ValueError("'similarities' must not be NaN for relevant results.")
 
-        # L_max within the tie
-        L_max = ns + 1.0  # == |G| - k + 1
+    # score repeated rows once
+    inverse = None
+    if deduplicate:
+        first, inverse = _unique_rows(similarities, match)
+        if first.size == target.size:
+            inverse = None
+        else:
+            similarities, match = similarities[first], match[first]
 
-        # blend expected and worst-case ranks
-        E_tau = (1.0 - tau) * E_L + tau * L_max
+    if target.size == 0:
+        scores = np.zeros(0)
+    elif _tsrr_kernel is not None and similarities.dtype in (np.float32, np.float64):
+        # other float types (float16, longdouble, non-native byte order) stay in NumPy
+        scores = _tsrr_kernel(similarities, match)
+    else:
+        scores = _tsrr_batch(similarities, match)
 
-        # TsRR
-        denom = r_pre + E_tau
-        scores.append(1.0 / denom)
+    if inverse is not None:
+        scores = scores[inverse]
 
-    return float(np.mean(scores)) if reduction == 'mean' else scores
+    return float(scores.mean()) if reduction == 'mean' else scores